@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# This file is part of the Juju GUI, which lets users view and manage Juju
+# environments within a graphical interface (https://launchpad.net/juju-gui).
+# Copyright (C) 2019 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License version 3, as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module implements a websocket proxy that records traffic.
+
+It sits between the GUI and a controller (or any other websocket backend, such
+as websocketreplay.py) and writes the frames of each connection to a log in the
+format read by websocketreplay.read_frames(), which websocketstats.py can
+summarize.  Note that websocketreplay.py itself can only play back logs of the
+py-juju protocol, not the Juju 2 protocol spoken by the GUI today.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import io
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import tornado.gen
+import tornado.httpclient
+import tornado.ioloop
+import tornado.web
+import tornado.websocket
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+HELP = """\
+Proxy websocket traffic between the GUI and a backend (UPSTREAM), recording
+the frames of each connection to its own log, FILE.1, FILE.2 and so on.
+
+Point the GUI at ws://localhost:PORT and the path it requests is appended to
+UPSTREAM, e.g. wss://10.0.0.1:17070 for a controller."""
+
+
+# Use the most precise clock available to measure the proxy overhead.
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Recorder(object):
+    """Write the frames of each connection to its own log file.
+
+    Logs are named after the given path with the connection number appended
+    (e.g. session.log.1, session.log.2), since every connection numbers its
+    requests from 1 and a log can only be replayed or summarized on its own.
+
+    All file operations happen in a background thread, so the proxy does not
+    wait for the disk while forwarding traffic.
+    """
+
+    def __init__(self, path, buffer_size=1024 * 1024):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.count = 0
+        self.tasks = queue.Queue()
+        # The open log files and those written to since their last flush,
+        # keyed by path.  These are only used by the writer thread.
+        self.outputs = {}
+        self.unflushed = set()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def open_log(self, url):
+        """Start a new log for a connection to the given URL.
+
+        Return the path of the log, to be passed to record() and close_log().
+        """
+        # Skip the logs of earlier runs rather than appending to them.
+        self.count += 1
+        while os.path.exists('{}.{}'.format(self.path, self.count)):
+            self.count += 1
+        path = '{}.{}'.format(self.path, self.count)
+        header = u'# connection {} to {}\n'.format(self.count, url)
+        self.tasks.put((self._open, (path, header)))
+        return path
+
+    def record(self, path, direction, message, timestamp):
+        """Queue a frame to be written to the given log."""
+        self.tasks.put(
+            (self._write_frame, (path, direction, message, timestamp)))
+
+    def close_log(self, path):
+        """Close the given log once its queued frames have been written."""
+        self.tasks.put((self._close, (path,)))
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            method, args = task
+            # A frame that cannot be written must not stop the recording of
+            # the frames that follow it.
+            try:
+                method(*args)
+                # Flush whenever the proxy goes quiet so the logs are usable
+                # while the session is still running.
+                if self.tasks.empty():
+                    for path in self.unflushed:
+                        self.outputs[path].flush()
+                    self.unflushed.clear()
+            except Exception as err:
+                print('error: cannot record frame:', err, file=sys.stderr)
+
+    def _open(self, path, header):
+        output = io.open(path, 'ab', buffering=self.buffer_size)
+        output.write(header.encode('utf-8'))
+        self.outputs[path] = output
+        self.unflushed.add(path)
+
+    def _write_frame(self, path, direction, message, timestamp):
+        # The log is a text format holding one JSON frame per line, so binary
+        # frames cannot be recorded.
+        if isinstance(message, bytes):
+            print('error: skipping binary frame of {} bytes'.format(
+                len(message)), file=sys.stderr)
+            return
+        # Multi-line payloads are compacted before they are written, so the
+        # recorded size of such frames is that of the compacted JSON rather
+        # than what went over the wire.
+        if '\n' in message:
+            try:
+                message = json.dumps(json.loads(message))
+            except ValueError:
+                print('error: skipping multi-line frame that is not JSON:',
+                      repr(message[:80]), file=sys.stderr)
+                return
+        line = u'{} {:.6f}\n{}\n'.format(direction, timestamp, message)
+        self.outputs[path].write(line.encode('utf-8'))
+        self.unflushed.add(path)
+
+    def _close(self, path):
+        self.unflushed.discard(path)
+        self.outputs.pop(path).close()
+
+    def close(self):
+        """Write any queued frames and close all the logs."""
+        self.tasks.put(None)
+        self.thread.join()
+        for output in self.outputs.values():
+            output.close()
+        self.outputs.clear()
+
+
+class Overhead(object):
+    """Keep track of the time the proxy adds to each frame."""
+
+    def __init__(self):
+        self.frames = {}
+
+    def add(self, direction, seconds):
+        count, total, peak = self.frames.get(direction, (0, 0, 0))
+        self.frames[direction] = (
+            count + 1, total + seconds, max(peak, seconds))
+
+    def report(self, label, out=sys.stdout):
+        print('{}:'.format(label), file=out)
+        for direction, (count, total, peak) in sorted(self.frames.items()):
+            print('  {}: {} frames, {:.1f}us mean, {:.1f}us max'.format(
+                direction, count, total / count * 1e6, peak * 1e6), file=out)
+        out.flush()
+
+
+class ProxyHandler(tornado.websocket.WebSocketHandler):
+    """Forward websocket frames to and from the upstream server."""
+
+    def initialize(self, upstream, recorder, totals, validate_cert=True):
+        self.upstream_url = upstream
+        self.recorder = recorder
+        # The overhead for this connection and for every connection so far.
+        self.overhead = Overhead()
+        self.totals = totals
+        self.validate_cert = validate_cert
+        self.upstream = None
+        self.log = None
+        self.closed = False
+        # Frames sent by the client before the upstream connection is ready.
+        self.pending = []
+
+    def check_origin(self, origin):
+        return True
+
+    @tornado.gen.coroutine
+    def open(self, path):
+        url = self.upstream_url.rstrip('/') + '/' + path
+        self.log = self.recorder.open_log(url)
+        print('connection opened, recording to', self.log)
+        request = tornado.httpclient.HTTPRequest(
+            url, validate_cert=self.validate_cert)
+        try:
+            upstream = yield tornado.websocket.websocket_connect(request)
+        except Exception as err:
+            print('error: cannot connect to upstream:', err)
+            self.close()
+            return
+        # The client may have gone away while we were connecting.
+        if self.closed:
+            upstream.close()
+            return
+        self.upstream = upstream
+        for message in self.pending:
+            self.forward(message, self.upstream.write_message, 'to server')
+        self.pending = None
+        # Recent versions of tornado do not deliver client messages until
+        # open() returns, so upstream messages are relayed separately.
+        tornado.ioloop.IOLoop.current().spawn_callback(self.relay_upstream)
+
+    @tornado.gen.coroutine
+    def relay_upstream(self):
+        """Send messages from the upstream server on to the client."""
+        while True:
+            message = yield self.upstream.read_message()
+            if self.closed:
+                return
+            if message is None:
+                self.close()
+                return
+            self.forward(message, self.write_message, 'to client')
+
+    def on_message(self, message):
+        if self.upstream is None:
+            self.pending.append(message)
+            return
+        self.forward(message, self.upstream.write_message, 'to server')
+
+    def forward(self, message, write_message, direction):
+        """Send the message on and record it, measuring the time taken."""
+        start = clock()
+        timestamp = time.time()
+        write_message(message, binary=isinstance(message, bytes))
+        self.recorder.record(self.log, direction, message, timestamp)
+        seconds = clock() - start
+        self.overhead.add(direction, seconds)
+        self.totals.add(direction, seconds)
+
+    def on_close(self):
+        print('connection closed...')
+        self.closed = True
+        if self.upstream is not None:
+            self.upstream.close()
+        if self.log is not None:
+            self.recorder.close_log(self.log)
+        self.overhead.report('connection overhead')
+
+
+def get_args(argv):
+    parser = argparse.ArgumentParser(
+        description=HELP, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('upstream', metavar='UPSTREAM',
+                        help='the base websocket URL to proxy to')
+    parser.add_argument('log', metavar='FILE',
+                        help='the base name of the per-connection logs')
+    parser.add_argument('-p', '--port', type=int, default=8081,
+                        help='the port to listen on (default: 8081)')
+    parser.add_argument('--insecure', action='store_true',
+                        help='do not validate the upstream certificate')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = get_args(argv[1:])
+    recorder = Recorder(args.log)
+    totals = Overhead()
+    application = tornado.web.Application([
+        (r'/(.*)', ProxyHandler, {
+            'upstream': args.upstream,
+            'recorder': recorder,
+            'totals': totals,
+            'validate_cert': not args.insecure,
+        }),
+    ])
+    application.listen(args.port)
+    ioloop = tornado.ioloop.IOLoop.instance()
+    # Stop cleanly when terminated so queued frames still reach the log.
+    signal.signal(
+        signal.SIGTERM,
+        lambda *args: ioloop.add_callback_from_signal(ioloop.stop))
+    try:
+        ioloop.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+        totals.report('total overhead')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -72,6 +72,18 @@ def infer_direction(message, seen_request_ids):
         return 'to server'
 
 
+def parse_direction(line):
+    """Split a direction line into the direction and its timestamp.
+
+    Recorded logs may follow the direction with the time, in seconds since the
+    epoch, at which the frame was seen (e.g., "to server 1571234567.123456").
+    The timestamp is None if the line does not include one.
+    """
+    parts = line.split()
+    timestamp = float(parts[2]) if len(parts) > 2 else None
+    return ' '.join(parts[:2]), timestamp
+
+
 Frame = collections.namedtuple('Frame', ['message', 'direction'])
 
 
@@ -91,7 +103,7 @@ def read_frames(source):
         # The data format is a bit icky, but since we only send json-encoded
         # messages, pulling them out of the log is straight-forward.
         if line.startswith('to '):
-            direction = line
+            direction, _ = parse_direction(line)
         elif line.startswith('{'):
             message = json.loads(line)
             # If the log does not contain direction info we have to guess.
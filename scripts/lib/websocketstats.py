@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# This file is part of the Juju GUI, which lets users view and manage Juju
+# environments within a graphical interface (https://launchpad.net/juju-gui).
+# Copyright (C) 2019 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License version 3, as published by
+# the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module summarizes logs of websocket traffic.
+
+It reads the same log format as websocketreplay.py, one frame at a time, so
+memory use does not grow with the size of the log.  The summary shows which
+API calls dominate the traffic between the GUI and the controller.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import collections
+import heapq
+import io
+import json
+import multiprocessing
+import sys
+
+from websocketreplay import infer_direction, parse_direction
+
+
+HELP = """\
+Summarize one or more logs of websocket traffic between the GUI and a backend.
+
+For every op the report includes request and response counts and sizes, and
+the number of responses sent for each request (fan-out).  It also shows the
+longest runs of frames sent in one direction, the busiest seconds for logs
+that include timestamps, and the largest frames seen."""
+
+
+# The number of request IDs remembered in order to infer message direction and
+# to match responses to their requests.  Responses arrive shortly after their
+# requests, so only recent IDs are needed, and bounding the number keeps memory
+# use constant however long the log is.
+MAX_TRACKED_REQUESTS = 10000
+
+# The op used for frames that do not include one.
+UNKNOWN_OP = '<unknown>'
+
+
+def get_request_id(message):
+    """Return the request ID of a message, or None if it has none.
+
+    The py-juju protocol uses "request_id" and the Juju 2 protocol spoken by
+    the GUI today uses "request-id".
+    """
+    request_id = message.get('request_id')
+    if request_id is None:
+        request_id = message.get('request-id')
+    return request_id
+
+
+def get_op(message):
+    """Return the op of a message, or UNKNOWN_OP if it has none.
+
+    Juju 2 requests name the facade and method (e.g. "Client.FullStatus")
+    rather than an op.  Their responses name neither, so responses have to
+    be matched to their requests by ID.
+    """
+    if 'op' in message:
+        return message['op']
+    if 'type' in message and 'request' in message:
+        return '{}.{}'.format(message['type'], message['request'])
+    return UNKNOWN_OP
+
+
+SizedFrame = collections.namedtuple(
+    'SizedFrame', ['message', 'direction', 'size', 'timestamp'])
+
+
+class RecentRequests(collections.OrderedDict):
+    """A mapping of request IDs to request ops that forgets the oldest IDs.
+
+    It can be passed to infer_direction() in place of the set of seen IDs.
+    """
+
+    def __init__(self, limit=MAX_TRACKED_REQUESTS):
+        super(RecentRequests, self).__init__()
+        self.limit = limit
+
+    def remember(self, request_id, op):
+        """Store the op of the given request, evicting the oldest if needed.
+
+        Request IDs are reused (every connection counts from 1), so a new
+        request replaces any earlier one with the same ID and becomes the
+        newest entry.
+        """
+        self.pop(request_id, None)
+        self[request_id] = op
+        if len(self) > self.limit:
+            self.popitem(last=False)
+
+
+def read_sized_frames(source, requests=None):
+    """Read frames and their sizes in bytes from an iterable of byte lines.
+
+    This works like websocketreplay.read_frames(), except that the size of
+    the encoded frame and the time it was recorded (or None) are included,
+    and only recent request IDs are remembered.
+
+    source: an iterable of lines, as bytes
+    requests: a RecentRequests instance used to track request IDs
+    """
+    if requests is None:
+        requests = RecentRequests()
+    direction = timestamp = None
+    for line in source:
+        line = line.strip()
+        if line.startswith(b'to '):
+            direction, timestamp = parse_direction(line.decode('ascii'))
+        elif line.startswith(b'{'):
+            message = json.loads(line.decode('utf-8'))
+            request_id = get_request_id(message)
+            # If the log does not contain direction info we have to guess,
+            # which infer_direction() does from the py-juju request ID key.
+            if direction is None:
+                key = {} if request_id is None else {'request_id': request_id}
+                direction = infer_direction(key, requests)
+            if request_id is not None and direction == 'to server':
+                requests.remember(request_id, get_op(message))
+            yield SizedFrame(message, direction, len(line), timestamp)
+            direction = timestamp = None
+
+
+class OpStats(object):
+    """Counters for the frames relating to a single op."""
+
+    __slots__ = (
+        'requests', 'request_bytes', 'responses', 'response_bytes',
+        'max_response_bytes', 'max_fanout', 'unsolicited',
+        'unsolicited_bytes')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def __getstate__(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    @property
+    def total_bytes(self):
+        return (
+            self.request_bytes + self.response_bytes + self.unsolicited_bytes)
+
+    def merge(self, other):
+        """Add the counters from another OpStats instance to this one."""
+        for name in ('requests', 'request_bytes', 'responses',
+                     'response_bytes', 'unsolicited', 'unsolicited_bytes'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.max_response_bytes = max(
+            self.max_response_bytes, other.max_response_bytes)
+        self.max_fanout = max(self.max_fanout, other.max_fanout)
+
+
+class LogStats(object):
+    """Summary statistics for one or more logs of websocket traffic.
+
+    Frames are fed in one at a time with add() and only a bounded amount of
+    state is kept, so logs of any size can be summarized.
+    """
+
+    def __init__(self, top=10, max_tracked=MAX_TRACKED_REQUESTS):
+        self.top = top
+        self.frames = 0
+        self.ops = collections.defaultdict(OpStats)
+        # The longest run of consecutive frames in each direction, stored as
+        # (frames, bytes) pairs.
+        self.bursts = {}
+        # The largest number of frames sent in each direction within a single
+        # second, stored as (frames, bytes) pairs.  Only logs that include
+        # timestamps contribute.
+        self.peak_rates = {}
+        # A min-heap of (size, sequence, op, direction, source) tuples holding
+        # the largest frames seen.
+        self.largest = []
+        # The number of responses seen for each recent request.
+        self._fanout = RecentRequests(max_tracked)
+        self._run = (None, 0, 0)
+        self._seconds = {}
+
+    def add(self, frame, op=None, source=''):
+        """Record a frame.
+
+        frame: a SizedFrame
+        op: the op of the request this frame answers, if known
+        source: the name of the log the frame was read from
+        """
+        message = frame.message
+        request_id = get_request_id(message)
+        op = op or get_op(message)
+        stats = self.ops[op]
+        if frame.direction == 'to server':
+            stats.requests += 1
+            stats.request_bytes += frame.size
+            if request_id is not None:
+                self._fanout.remember(request_id, 0)
+        elif request_id is None:
+            stats.unsolicited += 1
+            stats.unsolicited_bytes += frame.size
+        else:
+            stats.responses += 1
+            stats.response_bytes += frame.size
+            stats.max_response_bytes = max(
+                stats.max_response_bytes, frame.size)
+            fanout = self._fanout.get(request_id, 0) + 1
+            self._fanout[request_id] = fanout
+            stats.max_fanout = max(stats.max_fanout, fanout)
+        if len(self._fanout) > self._fanout.limit:
+            self._fanout.popitem(last=False)
+        self._add_to_burst(frame)
+        if frame.timestamp is not None:
+            self._add_to_rate(frame)
+        self._add_to_largest(frame, op, source)
+        self.frames += 1
+
+    def _add_to_burst(self, frame):
+        direction, count, size = self._run
+        if direction == frame.direction:
+            count, size = count + 1, size + frame.size
+        else:
+            direction, count, size = frame.direction, 1, frame.size
+        self._run = (direction, count, size)
+        if (count, size) > self.bursts.get(direction, (0, 0)):
+            self.bursts[direction] = (count, size)
+
+    def _add_to_rate(self, frame):
+        second = int(frame.timestamp)
+        current, count, size = self._seconds.get(frame.direction, (None, 0, 0))
+        if current == second:
+            count, size = count + 1, size + frame.size
+        else:
+            count, size = 1, frame.size
+        self._seconds[frame.direction] = (second, count, size)
+        if (count, size) > self.peak_rates.get(frame.direction, (0, 0)):
+            self.peak_rates[frame.direction] = (count, size)
+
+    def _add_to_largest(self, frame, op, source):
+        if self.top <= 0:
+            return
+        entry = (frame.size, self.frames, op, frame.direction, source)
+        if len(self.largest) < self.top:
+            heapq.heappush(self.largest, entry)
+        elif entry > self.largest[0]:
+            heapq.heapreplace(self.largest, entry)
+
+    def merge(self, other):
+        """Add the statistics from another LogStats instance to this one."""
+        self.frames += other.frames
+        for op, stats in other.ops.items():
+            self.ops[op].merge(stats)
+        for direction, burst in other.bursts.items():
+            self.bursts[direction] = max(
+                self.bursts.get(direction, (0, 0)), burst)
+        for direction, rate in other.peak_rates.items():
+            self.peak_rates[direction] = max(
+                self.peak_rates.get(direction, (0, 0)), rate)
+        self.largest = heapq.nlargest(
+            self.top, self.largest + other.largest)
+        heapq.heapify(self.largest)
+
+
+def analyze(path, top=10):
+    """Return the LogStats for the log stored at the given path."""
+    stats = LogStats(top=top)
+    requests = RecentRequests()
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    source = stdin if path == '-' else io.open(path, 'rb')
+    try:
+        for frame in read_sized_frames(source, requests):
+            # Responses do not always repeat the op of their request, so
+            # attribute them to the op that was originally requested.
+            op = None
+            if frame.direction == 'to client':
+                op = requests.get(get_request_id(frame.message))
+            stats.add(frame, op=op, source=path)
+    finally:
+        if source is not stdin:
+            source.close()
+    return stats
+
+
+def _analyze_star(args):
+    return analyze(*args)
+
+
+def analyze_all(paths, top=10, jobs=1):
+    """Return the combined LogStats for all the given logs.
+
+    If jobs is greater than one, logs are read in that many processes.
+    Standard input is always read by this process, since pool workers do not
+    share it.
+    """
+    total = LogStats(top=top)
+    files = [(path, top) for path in paths if path != '-']
+    if jobs > 1 and len(files) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(files)))
+        try:
+            results = pool.imap_unordered(_analyze_star, files)
+            if '-' in paths:
+                total.merge(analyze('-', top))
+            for stats in results:
+                total.merge(stats)
+        finally:
+            pool.close()
+            pool.join()
+        return total
+    for path in paths:
+        total.merge(analyze(path, top))
+    return total
+
+
+def print_report(stats, out=sys.stdout):
+    """Display the given LogStats, ordering ops by the bytes they used."""
+    print('frames: {}'.format(stats.frames), file=out)
+    print('', file=out)
+    header = ('op', 'reqs', 'req bytes', 'resps', 'resp bytes', 'max resp',
+              'fan-out', 'max fan', 'pushes', 'push bytes')
+    row = '{:<30} {:>7} {:>11} {:>7} {:>11} {:>9} {:>7} {:>7} {:>7} {:>11}'
+    print(row.format(*header), file=out)
+    ops = sorted(
+        stats.ops.items(), key=lambda item: item[1].total_bytes, reverse=True)
+    for op, op_stats in ops:
+        fanout = ''
+        if op_stats.requests:
+            fanout = '{:.2f}'.format(op_stats.responses / op_stats.requests)
+        print(row.format(
+            op, op_stats.requests, op_stats.request_bytes, op_stats.responses,
+            op_stats.response_bytes, op_stats.max_response_bytes, fanout,
+            op_stats.max_fanout, op_stats.unsolicited,
+            op_stats.unsolicited_bytes), file=out)
+    print('', file=out)
+    print('longest bursts:', file=out)
+    for direction, (count, size) in sorted(stats.bursts.items()):
+        print('  {}: {} frames, {} bytes'.format(direction, count, size),
+              file=out)
+    print('', file=out)
+    if stats.peak_rates:
+        print('busiest seconds:', file=out)
+        for direction, (count, size) in sorted(stats.peak_rates.items()):
+            print('  {}: {} frames/s, {} bytes/s'.format(
+                direction, count, size), file=out)
+        print('', file=out)
+    if stats.top <= 0:
+        return
+    print('largest frames:', file=out)
+    for size, index, op, direction, source in sorted(
+            stats.largest, reverse=True):
+        print('  {} bytes: {} {} (frame {} of {})'.format(
+            size, op, direction, index + 1, source), file=out)
+
+
+def get_args(argv):
+    parser = argparse.ArgumentParser(description=HELP)
+    parser.add_argument(
+        'logs', metavar='FILE', nargs='+',
+        help='a log of websocket traffic, or - to read standard input')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='the number of processes used to read logs (default: 1)')
+    parser.add_argument(
+        '-n', '--top', type=int, default=10,
+        help='the number of largest frames to show, or 0 to show none '
+             '(default: 10)')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = get_args(argv[1:])
+    print_report(analyze_all(args.logs, top=args.top, jobs=args.jobs))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,7 +1,13 @@
+import hashlib
 import os
+import re
+from collections import namedtuple
+from fnmatch import fnmatchcase
+from functools import lru_cache
 from urllib.parse import urljoin
 
 import flask
+import yaml
 
 
 gui = flask.Blueprint(
@@ -11,6 +17,14 @@ gui = flask.Blueprint(
 JAAS_URL = "https://jaas.ai"
 DOCS_URL = "https://docs.jujucharms.com"
 INDEX = "index.html"
+# The number of hosts that are not listed exactly in the hosts file whose
+# config.js variant is remembered.
+CONFIG_CACHE_SIZE = 1024
+
+# The settings that the hosts file can override for each host.
+HOST_SETTINGS = ("JAAS_API_BASE", "JIMM_WSS_URL")
+
+ConfigVariant = namedtuple("ConfigVariant", ["body", "etag"])
 
 
 def loggedIn():
@@ -85,8 +99,120 @@ def robots():
     return flask.Response("", mimetype="text/plain")
 
 
-@gui.route("/config.js")
-def config():
+def render_config(jaas_api_base, jimm_wss_url, debug):
+    body = flask.render_template(
+        "config.js.jinja",
+        apiAddress=jimm_wss_url,
+        baseUrl="/",
+        bundleServiceURL=jaas_api_base + "/bundleservice",
+        charmstoreURL=jaas_api_base + "/charmstore",
+        controllerSocketTemplate="wss://$server:$port/api",
+        flags="{terminal: true, support: true, anssr: true, expert: true}",
+        gisf="true",
+        jujushellURL="wss://shell.jujugui.org:443/ws/",
+        GTM_enabled="false" if debug == "true" else "true",
+        uuid="",
+        paymentURL=jaas_api_base + "/payment",
+        plansURL=jaas_api_base + "/omnibus",
+        ratesURL=jaas_api_base + "/omnibus",
+        socketTemplate="wss://$server:$port/model/$uuid/api",
+        staticURL="/static",
+        termsURL=jaas_api_base + "/terms",
+    ).encode("utf-8")
+    return ConfigVariant(body, hashlib.sha1(body).hexdigest())
+
+
+class HostConfigs:
+    """
+    The config.js variants served to each host, rendered once at startup.
+
+    Hosts are matched exactly first, then against any wildcard patterns
+    (e.g. "*.jimm.example.com"), falling back to the default variant.
+    Pattern matches are remembered in a bounded cache, so arbitrary Host
+    headers cannot grow memory.
+    """
+
+    def __init__(self, default, hosts, cache_size=CONFIG_CACHE_SIZE):
+        self.default = default
+        self.hosts = {}
+        self.patterns = []
+        for host, variant in hosts.items():
+            host = host.lower()
+            # Only "*" and "?" mark patterns, so IPv6 literals such as
+            # "[::1]" are matched exactly.
+            if "*" in host or "?" in host:
+                self.patterns.append((host, variant))
+            else:
+                self.hosts[host] = variant
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def get(self, host):
+        host = re.sub(r":\d+$", "", host.lower())
+        variant = self.hosts.get(host)
+        if variant is None:
+            variant = self.match(host)
+        return variant
+
+    def _match(self, host):
+        for pattern, variant in self.patterns:
+            if fnmatchcase(host, pattern):
+                return variant
+        return self.default
+
+
+def check_host_settings(path, settings):
+    """
+    Return the host settings loaded from path, raising a ValueError that
+    names the file and the entry if they are not as load_configs expects.
+    """
+    if not isinstance(settings, dict):
+        raise ValueError(
+            "{}: expected a mapping of hosts to settings".format(path)
+        )
+    checked = {}
+    for host, host_settings in settings.items():
+        if not isinstance(host, str):
+            raise ValueError(
+                "{}: host {!r} must be a string (quote it)".format(path, host)
+            )
+        if host_settings is None:
+            host_settings = {}
+        if not isinstance(host_settings, dict):
+            raise ValueError(
+                "{}: settings for {!r} must be a mapping".format(path, host)
+            )
+        for name, value in host_settings.items():
+            if name not in HOST_SETTINGS:
+                raise ValueError(
+                    "{}: unknown setting {!r} for {!r} (expected one of "
+                    "{})".format(path, name, host, ", ".join(HOST_SETTINGS))
+                )
+            if not isinstance(value, str):
+                raise ValueError(
+                    "{}: {} for {!r} must be a string".format(
+                        path, name, host
+                    )
+                )
+        checked[host] = host_settings
+    return checked
+
+
+@gui.record_once
+def load_configs(state):
+    """
+    Render every config.js variant when the blueprint is registered.
+
+    CONFIG_HOSTS_FILE may name a YAML file mapping hosts to the
+    JAAS_API_BASE and JIMM_WSS_URL they use, e.g.:
+
+        jaas.example.com:
+          JAAS_API_BASE: https://api.example.com
+          JIMM_WSS_URL: jimm.example.com:443
+
+    Settings missing from the file (including hosts listed with no
+    settings), and hosts not listed in it, use the environment variables of
+    the same name.
+    """
     JAAS_API_BASE = os.environ.get(
         "JAAS_API_BASE", default="https://api.jujucharms.com"
     )
@@ -94,30 +220,35 @@ def config():
         "JIMM_WSS_URL", default="jimm.jujucharms.com:443"
     )
     FLASK_DEBUG = os.environ.get("FLASK_DEBUG", default="false")
+    CONFIG_HOSTS_FILE = os.environ.get("CONFIG_HOSTS_FILE")
 
-    return (
-        flask.render_template(
-            "config.js.jinja",
-            apiAddress=JIMM_WSS_URL,
-            baseUrl="/",
-            bundleServiceURL=JAAS_API_BASE + "/bundleservice",
-            charmstoreURL=JAAS_API_BASE + "/charmstore",
-            controllerSocketTemplate="wss://$server:$port/api",
-            flags="{terminal: true, support: true, anssr: true, expert: true}",
-            gisf="true",
-            jujushellURL="wss://shell.jujugui.org:443/ws/",
-            GTM_enabled="false" if FLASK_DEBUG == "true" else "true",
-            uuid="",
-            paymentURL=JAAS_API_BASE + "/payment",
-            plansURL=JAAS_API_BASE + "/omnibus",
-            ratesURL=JAAS_API_BASE + "/omnibus",
-            socketTemplate="wss://$server:$port/model/$uuid/api",
-            staticURL="/static",
-            termsURL=JAAS_API_BASE + "/terms",
-        ),
-        200,
-        {"Content-Type": "text/javascript"},
-    )
+    settings = {}
+    if CONFIG_HOSTS_FILE:
+        with open(CONFIG_HOSTS_FILE) as hosts_file:
+            settings = yaml.safe_load(hosts_file) or {}
+        settings = check_host_settings(CONFIG_HOSTS_FILE, settings)
+
+    with state.app.app_context():
+        default = render_config(JAAS_API_BASE, JIMM_WSS_URL, FLASK_DEBUG)
+        hosts = {
+            host: render_config(
+                host_settings.get("JAAS_API_BASE", JAAS_API_BASE),
+                host_settings.get("JIMM_WSS_URL", JIMM_WSS_URL),
+                FLASK_DEBUG,
+            )
+            for host, host_settings in settings.items()
+        }
+
+    state.app.extensions["gui_configs"] = HostConfigs(default, hosts)
+
+
+@gui.route("/config.js")
+def config():
+    configs = flask.current_app.extensions["gui_configs"]
+    variant = configs.get(flask.request.host)
+    response = flask.Response(variant.body, mimetype="text/javascript")
+    response.set_etag(variant.etag)
+    return response.make_conditional(flask.request)
 
 
 @gui.route("/_status/check")